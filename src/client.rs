@@ -1,14 +1,17 @@
 use anyhow::{anyhow, Result};
+use bytes::Bytes;
 use log::debug;
 use reqwest::header;
 use reqwest::Client;
 use reqwest::StatusCode;
+use std::future::Future;
 use std::time::Duration;
 
 const MAX_RETRIES: u32 = 3;
 const RETRY_BACKOFF_MS: u64 = 500;
 const RETRY_STATUS_CODES: &[u16] = &[429, 500, 502, 503, 504];
 const USER_AGENT: &str = "Pi-hole Blocklist Optimizer/3.0";
+const TCP_KEEPALIVE_SECS: u64 = 60;
 
 #[derive(Clone)]
 pub struct HttpClient {
@@ -16,7 +19,6 @@ pub struct HttpClient {
 }
 
 pub struct DownloadResult {
-    pub content: Option<Vec<u8>>,
     pub etag: Option<String>,
     pub last_modified: Option<String>,
     pub was_modified: bool,
@@ -27,6 +29,7 @@ impl HttpClient {
         let client = Client::builder()
             .timeout(Duration::from_secs(timeout_secs))
             .user_agent(USER_AGENT)
+            .tcp_keepalive(Duration::from_secs(TCP_KEEPALIVE_SECS))
             .gzip(true)
             .brotli(true)
             .build()?;
@@ -34,12 +37,20 @@ impl HttpClient {
         Ok(Self { client })
     }
 
-    pub async fn download(
+    /// Fetch `url`, handing the body to `on_chunk` piece by piece as it arrives
+    /// so callers never hold the whole response in memory. The next chunk is
+    /// not read until the future `on_chunk` returns has completed.
+    pub async fn download<F, Fut>(
         &self,
         url: &str,
         etag: Option<&str>,
         last_modified: Option<&str>,
-    ) -> Result<DownloadResult> {
+        mut on_chunk: F,
+    ) -> Result<DownloadResult>
+    where
+        F: FnMut(Bytes) -> Fut,
+        Fut: Future<Output = ()>,
+    {
         let mut attempts = 0u32;
 
         loop {
@@ -53,14 +64,24 @@ impl HttpClient {
             }
 
             match request.send().await {
-                Ok(response) => {
+                Ok(mut response) => {
                     let status = response.status();
 
-                    if status == StatusCode::NOT_MODIFIED {
+                    let new_etag = header_value(&response, header::ETAG);
+                    let new_last_modified = header_value(&response, header::LAST_MODIFIED);
+
+                    // Some servers ignore If-None-Match and answer 200 with the
+                    // same ETag; either way the body is left unread
+                    let unchanged = status == StatusCode::NOT_MODIFIED
+                        || (status.is_success()
+                            && etag
+                                .zip(new_etag.as_deref())
+                                .is_some_and(|(sent, got)| etags_match(sent, got)));
+                    if unchanged {
                         return Ok(DownloadResult {
-                            content: None,
-                            etag: etag.map(String::from),
-                            last_modified: last_modified.map(String::from),
+                            etag: new_etag.or_else(|| etag.map(String::from)),
+                            last_modified: new_last_modified
+                                .or_else(|| last_modified.map(String::from)),
                             was_modified: false,
                         });
                     }
@@ -79,21 +100,11 @@ impl HttpClient {
                         return Err(anyhow!("HTTP {status} for {url}"));
                     }
 
-                    let new_etag = response
-                        .headers()
-                        .get(header::ETAG)
-                        .and_then(|v| v.to_str().ok())
-                        .map(String::from);
-                    let new_last_modified = response
-                        .headers()
-                        .get(header::LAST_MODIFIED)
-                        .and_then(|v| v.to_str().ok())
-                        .map(String::from);
-
-                    let content = response.bytes().await?.to_vec();
+                    while let Some(chunk) = response.chunk().await? {
+                        on_chunk(chunk).await;
+                    }
 
                     return Ok(DownloadResult {
-                        content: Some(content),
                         etag: new_etag,
                         last_modified: new_last_modified,
                         was_modified: true,
@@ -113,3 +124,34 @@ impl HttpClient {
         }
     }
 }
+
+fn header_value(response: &reqwest::Response, name: header::HeaderName) -> Option<String> {
+    response
+        .headers()
+        .get(name)
+        .and_then(|v| v.to_str().ok())
+        .map(String::from)
+}
+
+/// Weak ETag comparison (RFC 9110 section 8.8.3.2): the `W/` prefix is ignored,
+/// since proxies and compressing servers often weaken a strong tag.
+fn etags_match(a: &str, b: &str) -> bool {
+    fn opaque(tag: &str) -> &str {
+        let tag = tag.trim();
+        tag.strip_prefix("W/").unwrap_or(tag)
+    }
+    opaque(a) == opaque(b)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn etags_match_ignores_weak_prefix() {
+        assert!(etags_match("\"abc\"", "\"abc\""));
+        assert!(etags_match("W/\"abc\"", "\"abc\""));
+        assert!(etags_match("\"abc\"", "W/\"abc\""));
+        assert!(!etags_match("\"abc\"", "\"abd\""));
+    }
+}
@@ -12,10 +12,12 @@ pub struct AppConfig {
     pub base_dir: String,
     pub prod_dir: String,
     pub threads: usize,
+    pub max_per_host: usize,
     pub timeout: u64,
     pub skip_download: bool,
     pub skip_optimize: bool,
     pub incremental: bool,
+    pub sort_per_list: bool,
     pub dry_run: bool,
     pub quiet: bool,
     pub verbose: bool,
@@ -24,7 +26,7 @@ pub struct AppConfig {
     pub abp_lists: Vec<String>,
 }
 
-#[derive(Debug, Clone)]
+#[derive(Debug)]
 pub struct Blocklist {
     pub url: String,
     pub name: String,
@@ -32,6 +34,7 @@ pub struct Blocklist {
     pub allow_wildcards: bool,
     pub etag: Option<String>,
     pub last_modified: Option<String>,
+    pub content_sha256: Option<String>,
 }
 
 #[derive(Debug)]
@@ -99,6 +102,7 @@ pub fn load_blocklists(config_file: &str, progress: &ProgressTracker) -> Result<
         let cached = progress.get(&parsed.name);
         let etag = cached.and_then(|c| c.etag.clone());
         let last_modified = cached.and_then(|c| c.last_modified.clone());
+        let content_sha256 = cached.and_then(|c| c.content_sha256.clone());
 
         blocklists.push(Blocklist {
             url: parsed.url,
@@ -107,6 +111,7 @@ pub fn load_blocklists(config_file: &str, progress: &ProgressTracker) -> Result<
             allow_wildcards: parsed.allow_wildcards,
             etag,
             last_modified,
+            content_sha256,
         });
     }
 
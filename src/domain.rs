@@ -1,22 +1,5 @@
-use regex::Regex;
-use std::sync::LazyLock;
-
 const MAX_DOMAIN_LENGTH: usize = 253;
-
-static DOMAIN_RE: LazyLock<Regex> = LazyLock::new(|| {
-    Regex::new(
-        r"^(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z0-9][a-zA-Z0-9-]{0,61}[a-zA-Z0-9]$",
-    )
-    .unwrap()
-});
-
-static ADBLOCK_RE: LazyLock<Regex> =
-    LazyLock::new(|| Regex::new(r"^\|\|(.+?)\^(?:\$.*)?$").unwrap());
-
-static IP_DOMAIN_RE: LazyLock<Regex> =
-    LazyLock::new(|| Regex::new(r"^\s*\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\s+(\S+)$").unwrap());
-
-static COMMENT_RE: LazyLock<Regex> = LazyLock::new(|| Regex::new(r"[#!].*$").unwrap());
+const MAX_LABEL_LENGTH: usize = 63;
 
 pub fn validate_domain(domain: &str) -> bool {
     if domain.is_empty() || domain == "localhost" || domain.ends_with(".local") {
@@ -30,11 +13,38 @@ pub fn validate_domain(domain: &str) -> bool {
     } else {
         domain
     };
-    DOMAIN_RE.is_match(check)
+    is_hostname(check.as_bytes())
 }
 
+/// Single pass over the bytes: two or more dot-separated labels of 1-63 ASCII
+/// letters, digits or hyphens, with no hyphen at either end of a label, and a
+/// final label of at least two characters.
+fn is_hostname(bytes: &[u8]) -> bool {
+    let mut labels = 0;
+    let mut last_len = 0;
+    for label in bytes.split(|&b| b == b'.') {
+        let (Some(&first), Some(&last)) = (label.first(), label.last()) else {
+            return false;
+        };
+        if label.len() > MAX_LABEL_LENGTH
+            || first == b'-'
+            || last == b'-'
+            || !label
+                .iter()
+                .all(|&b| b.is_ascii_alphanumeric() || b == b'-')
+        {
+            return false;
+        }
+        labels += 1;
+        last_len = label.len();
+    }
+    labels >= 2 && last_len >= 2
+}
+
+/// Lowercase and strip trailing dots. Only ASCII letters are folded: anything
+/// else fails validation anyway, so Unicode case tables are never consulted.
 pub fn normalize_domain(domain: &str) -> String {
-    domain.to_lowercase().trim_end_matches('.').to_string()
+    domain.trim_end_matches('.').to_ascii_lowercase()
 }
 
 #[derive(Debug, Clone, PartialEq, Eq)]
@@ -44,72 +54,205 @@ pub enum Entry {
 }
 
 impl Entry {
-    pub fn to_key(&self) -> String {
+    /// Normalize `domain` into an entry without validating it.
+    pub fn new(domain: &str, wildcard: bool) -> Self {
+        let d = normalize_domain(domain);
+        if wildcard {
+            Entry::Wildcard(d)
+        } else {
+            Entry::Exact(d)
+        }
+    }
+
+    #[cfg(test)]
+    pub fn domain(&self) -> &str {
         match self {
-            Entry::Exact(d) => d.clone(),
-            Entry::Wildcard(d) => format!("||{d}^"),
+            Entry::Exact(d) | Entry::Wildcard(d) => d,
         }
     }
-}
 
-fn make_exact(domain: &str) -> Option<Entry> {
-    let d = normalize_domain(domain);
-    if !d.contains('*') && validate_domain(&d) {
-        Some(Entry::Exact(d))
-    } else {
-        None
+    /// Turn the entry into its output form, reusing the normalized string.
+    pub fn into_key(self) -> String {
+        match self {
+            Entry::Exact(d) => d,
+            Entry::Wildcard(mut d) => {
+                d.reserve_exact(3);
+                d.insert_str(0, "||");
+                d.push('^');
+                d
+            }
+        }
     }
 }
 
-fn make_wildcard(domain: &str) -> Option<Entry> {
-    let d = normalize_domain(domain);
-    if !d.contains('*') && validate_domain(&d) {
-        Some(Entry::Wildcard(d))
-    } else {
-        None
+/// Whether a normalized domain is acceptable as a blocklist entry.
+pub fn is_valid_entry(domain: &str) -> bool {
+    !domain.contains('*') && validate_domain(domain)
+}
+
+/// Whether `s` looks like a dotted-quad IPv4 address (1-3 ASCII digits per octet).
+fn is_ipv4(s: &str) -> bool {
+    let mut octets = 0;
+    for part in s.split('.') {
+        if part.is_empty() || part.len() > 3 || !part.bytes().all(|b| b.is_ascii_digit()) {
+            return false;
+        }
+        octets += 1;
     }
+    octets == 4
 }
 
-pub fn extract_entry(line: &str, allow_wildcards: bool) -> Option<Entry> {
-    let line = line.trim();
-    if line.is_empty() || line.starts_with('#') || line.starts_with('!') {
+/// Split a hosts-file line (`<ipv4> <domain>`) into its domain field.
+/// Returns `None` unless the line is exactly an IPv4 address followed by one token.
+fn split_hosts_line(line: &str) -> Option<&str> {
+    let mut fields = line.split_ascii_whitespace();
+    let ip = fields.next()?;
+    let domain = fields.next()?;
+    if fields.next().is_some() || !is_ipv4(ip) {
         return None;
     }
+    Some(domain)
+}
 
-    let line = COMMENT_RE.replace(line, "");
-    let line = line.trim();
-    if line.is_empty() {
+/// Slice the domain out of an AdBlock rule (`||domain^` or `||domain^$options`).
+fn split_adblock_rule(rule: &str) -> Option<&str> {
+    let (domain, rest) = rule.split_once('^')?;
+    if domain.is_empty() || !(rest.is_empty() || rest.starts_with('$')) {
         return None;
     }
+    Some(domain)
+}
 
-    if let Some(caps) = IP_DOMAIN_RE.captures(line) {
-        return make_exact(caps.get(1)?.as_str());
+/// Number of leading lines sampled when sniffing a list's format.
+pub const FORMAT_DETECTION_LINES: usize = 200;
+
+/// Layout of a blocklist, sniffed from its first lines so the parser can try
+/// the matching form first instead of walking every form on every line.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum ListFormat {
+    Hosts,
+    Adblock,
+    Plain,
+    Mixed,
+}
+
+impl ListFormat {
+    /// Like `split_entry`, but tries this format's form first. Lines that don't
+    /// fit it fall back to the general parser, so the result is identical.
+    pub fn split_entry(self, line: &str, allow_wildcards: bool) -> Option<(&str, bool)> {
+        let line = strip_line(line)?;
+        let hit = match self {
+            ListFormat::Hosts => split_hosts_line(line).map(|d| (d, false)),
+            // A malformed `||` rule is rejected by the general parser too.
+            ListFormat::Adblock => match line.strip_prefix("||") {
+                Some(rule) => return split_adblock_rule(rule).map(|d| (d, allow_wildcards)),
+                None => None,
+            },
+            ListFormat::Plain => split_plain_line(line).map(|d| (d, false)),
+            ListFormat::Mixed => None,
+        };
+        hit.or_else(|| split_stripped(line, allow_wildcards))
     }
+}
 
-    if let Some(caps) = ADBLOCK_RE.captures(line) {
-        let domain = caps.get(1)?.as_str();
-        return if allow_wildcards {
-            make_wildcard(domain)
+/// Sniff the format of a list from its leading lines. Comments and blank lines
+/// are ignored; any disagreement between entries makes the list `Mixed`.
+pub fn detect_format<'a>(lines: impl IntoIterator<Item = &'a str>) -> ListFormat {
+    let mut detected = None;
+    for line in lines.into_iter().take(FORMAT_DETECTION_LINES) {
+        let Some(line) = strip_line(line) else {
+            continue;
+        };
+        let format = if split_hosts_line(line).is_some() {
+            ListFormat::Hosts
+        } else if line.starts_with("||") {
+            ListFormat::Adblock
+        } else if split_plain_line(line).is_some() {
+            ListFormat::Plain
         } else {
-            make_exact(domain)
+            return ListFormat::Mixed;
         };
+        match detected {
+            None => detected = Some(format),
+            Some(seen) if seen != format => return ListFormat::Mixed,
+            Some(_) => {}
+        }
+    }
+    detected.unwrap_or(ListFormat::Mixed)
+}
+
+/// Trim `line` and cut any comment. Returns `None` if nothing is left.
+fn strip_line(line: &str) -> Option<&str> {
+    let line = line.trim();
+
+    // Dispatch on the first byte; comment lines never reach the scanners below.
+    let first = *line.as_bytes().first()?;
+    if first == b'#' || first == b'!' {
+        return None;
+    }
+
+    // Strip inline comments without a regex substitution
+    let line = match line.find(['#', '!']) {
+        Some(cut) => line[..cut].trim_end(),
+        None => line,
+    };
+    (!line.is_empty()).then_some(line)
+}
+
+/// A bare domain line: a single token that isn't one of the wildcard forms.
+/// Any whitespace disqualifies it, so tab-separated hosts lines in a list
+/// sniffed as plain still reach the hosts parser.
+fn split_plain_line(line: &str) -> Option<&str> {
+    if line.starts_with("||")
+        || line.starts_with("*.")
+        || line
+            .bytes()
+            .any(|b| b.is_ascii_whitespace() || b == b'/' || b == b'?')
+    {
+        return None;
+    }
+    Some(line)
+}
+
+/// Slice the candidate domain out of a blocklist line without normalizing or
+/// validating it. The flag is true when the entry should become a wildcard.
+/// The pipeline goes through `ListFormat::split_entry`, which agrees with this.
+#[cfg(test)]
+pub fn split_entry(line: &str, allow_wildcards: bool) -> Option<(&str, bool)> {
+    split_stripped(strip_line(line)?, allow_wildcards)
+}
+
+fn split_stripped(line: &str, allow_wildcards: bool) -> Option<(&str, bool)> {
+    if line.as_bytes()[0].is_ascii_digit() {
+        if let Some(domain) = split_hosts_line(line) {
+            return Some((domain, false));
+        }
+    }
+
+    if let Some(rule) = line.strip_prefix("||") {
+        return Some((split_adblock_rule(rule)?, allow_wildcards));
     }
 
     if let Some(stripped) = line.strip_prefix("*.") {
-        return if allow_wildcards {
-            make_wildcard(stripped)
-        } else {
-            make_exact(stripped)
-        };
+        return Some((stripped, allow_wildcards));
     }
 
-    if !line.contains(' ') && !line.contains('/') && !line.contains('?') {
-        return make_exact(line);
+    if !line.contains([' ', '/', '?']) {
+        return Some((line, false));
     }
 
     None
 }
 
+/// Single-line reference parser; the pipeline uses `split_entry` directly so it
+/// can skip validation of keys it has already accepted.
+#[cfg(test)]
+pub fn extract_entry(line: &str, allow_wildcards: bool) -> Option<Entry> {
+    let (domain, wildcard) = split_entry(line, allow_wildcards)?;
+    let entry = Entry::new(domain, wildcard);
+    is_valid_entry(entry.domain()).then_some(entry)
+}
+
 pub fn format_num(n: usize) -> String {
     let s = n.to_string();
     let mut result = String::with_capacity(s.len() + s.len() / 3);
@@ -135,12 +278,48 @@ mod tests {
         assert!(!validate_domain("test.local"));
         assert!(!validate_domain(""));
         assert!(!validate_domain("-invalid.com"));
+        assert!(!validate_domain("exämple.com"));
+    }
+
+    #[test]
+    fn test_validate_domain_matches_reference_pattern() {
+        let reference = regex::Regex::new(
+            r"^(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z0-9][a-zA-Z0-9-]{0,61}[a-zA-Z0-9]$",
+        )
+        .unwrap();
+        let long_label = "a".repeat(63);
+        let too_long_label = "a".repeat(64);
+        let cases = [
+            "a.co".to_string(),
+            "a.c".to_string(),
+            "a-.com".to_string(),
+            "a.-com".to_string(),
+            "x-1.y-2.com".to_string(),
+            "a..com".to_string(),
+            ".a.com".to_string(),
+            "a.com.".to_string(),
+            "com".to_string(),
+            "under_score.com".to_string(),
+            "1.2.3.4".to_string(),
+            "a.b.c9".to_string(),
+            format!("{long_label}.com"),
+            format!("{too_long_label}.com"),
+            format!("a.{long_label}"),
+        ];
+        for case in &cases {
+            assert_eq!(
+                is_hostname(case.as_bytes()),
+                reference.is_match(case),
+                "{case}"
+            );
+        }
     }
 
     #[test]
     fn test_normalize_domain() {
         assert_eq!(normalize_domain("Example.COM"), "example.com");
         assert_eq!(normalize_domain("test.com."), "test.com");
+        assert_eq!(normalize_domain("ADS.Test.com.."), "ads.test.com");
     }
 
     #[test]
@@ -191,6 +370,23 @@ mod tests {
         assert_eq!(extract_entry("*.", true), None);
     }
 
+    #[test]
+    fn test_extract_entry_hosts_variants() {
+        assert_eq!(
+            extract_entry("127.0.0.1\tads.example.com", false),
+            Some(Entry::Exact("ads.example.com".to_string()))
+        );
+        assert_eq!(extract_entry("0.0.0.0 a.com b.com", false), None);
+        assert_eq!(extract_entry("::1 localhost", false), None);
+        assert_eq!(extract_entry("0.0.0.0", false), None);
+    }
+
+    #[test]
+    fn test_extract_entry_abp_rejects_trailing_garbage() {
+        assert_eq!(extract_entry("||foo.com^bar", true), None);
+        assert_eq!(extract_entry("||^", true), None);
+    }
+
     #[test]
     fn test_extract_entry_inline_comment() {
         assert_eq!(
@@ -200,10 +396,62 @@ mod tests {
     }
 
     #[test]
-    fn test_entry_to_key() {
-        assert_eq!(Entry::Exact("foo.com".to_string()).to_key(), "foo.com");
+    fn test_detect_format() {
+        let hosts = ["# hosts", "0.0.0.0 a.com", "", "127.0.0.1 b.com # note"];
+        assert_eq!(detect_format(hosts), ListFormat::Hosts);
+        assert_eq!(
+            detect_format(["! abp", "||a.com^", "||b.com^$third-party"]),
+            ListFormat::Adblock
+        );
+        assert_eq!(detect_format(["a.com", "b.com"]), ListFormat::Plain);
+        assert_eq!(detect_format(["a.com", "||b.com^"]), ListFormat::Mixed);
+        assert_eq!(detect_format(["*.a.com"]), ListFormat::Mixed);
+        assert_eq!(detect_format(["# only comments"]), ListFormat::Mixed);
+    }
+
+    #[test]
+    fn test_format_split_matches_general_parser() {
+        let lines = [
+            "0.0.0.0 a.com",
+            "0.0.0.0 a.com b.com",
+            "0.0.0.0\tads.example.com",
+            "127.0.0.1\t\ttrack.example.net",
+            "||b.com^",
+            "||b.com^junk",
+            "*.c.com",
+            "d.com # note",
+            "# comment",
+            "e.com/path",
+            "",
+        ];
+        for format in [
+            ListFormat::Hosts,
+            ListFormat::Adblock,
+            ListFormat::Plain,
+            ListFormat::Mixed,
+        ] {
+            for line in lines {
+                for allow in [true, false] {
+                    assert_eq!(
+                        format.split_entry(line, allow),
+                        split_entry(line, allow),
+                        "{format:?} {line:?}"
+                    );
+                    if line.contains('\t') {
+                        assert!(format
+                            .split_entry(line, allow)
+                            .is_some_and(|(d, _)| !d.contains('\t')));
+                    }
+                }
+            }
+        }
+    }
+
+    #[test]
+    fn test_entry_into_key() {
+        assert_eq!(Entry::Exact("foo.com".to_string()).into_key(), "foo.com");
         assert_eq!(
-            Entry::Wildcard("foo.com".to_string()).to_key(),
+            Entry::Wildcard("foo.com".to_string()).into_key(),
             "||foo.com^"
         );
     }
@@ -1,6 +1,7 @@
 mod client;
 mod config;
 mod domain;
+mod packed;
 mod pipeline;
 mod progress;
 mod whitelist;
@@ -32,10 +33,14 @@ struct Cli {
     #[arg(short, long, default_value = "pihole_blocklists_prod")]
     prod_dir: String,
 
-    /// Number of concurrent downloads (1-16)
+    /// Number of concurrent downloads (1-16); see also --max-per-host
     #[arg(short, long, default_value_t = 4)]
     threads: usize,
 
+    /// Concurrent downloads allowed from any one host (1-16)
+    #[arg(long, default_value_t = 8)]
+    max_per_host: usize,
+
     /// HTTP request timeout in seconds
     #[arg(long, default_value_t = 30)]
     timeout: u64,
@@ -52,6 +57,10 @@ struct Cli {
     #[arg(long)]
     no_incremental: bool,
 
+    /// Sort each individual optimized list (production lists are always sorted)
+    #[arg(long)]
+    sort_per_list: bool,
+
     /// Dry run mode (show what would happen without doing it)
     #[arg(long)]
     dry_run: bool,
@@ -109,10 +118,12 @@ async fn main() {
         base_dir: cli.base_dir,
         prod_dir: cli.prod_dir,
         threads: cli.threads.clamp(1, 16),
+        max_per_host: cli.max_per_host.clamp(1, 16),
         timeout: if cli.timeout == 0 { 30 } else { cli.timeout },
         skip_download: cli.skip_download,
         skip_optimize: cli.skip_optimize,
         incremental: !cli.no_incremental,
+        sort_per_list: cli.sort_per_list,
         dry_run: cli.dry_run,
         quiet: cli.quiet,
         verbose: cli.verbose,
@@ -140,7 +151,15 @@ async fn main() {
         }
     };
 
-    if let Err(e) = manager.run().await {
+    let result = tokio::select! {
+        result = manager.run() => result,
+        _ = tokio::signal::ctrl_c() => Err(anyhow::anyhow!("Interrupted")),
+    };
+    // Dropping the manager saves whatever progress was recorded, even when the
+    // run failed or was interrupted part way through
+    drop(manager);
+
+    if let Err(e) = result {
         log::error!("{e:#}");
         process::exit(1);
     }
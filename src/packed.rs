@@ -0,0 +1,60 @@
+/// Domains stored back to back in one buffer, with the end offset of each.
+/// A list costs its bytes plus four per domain, where a `HashSet<String>`
+/// pays a table slot, a string header and a heap allocation for every entry.
+#[derive(Debug, Default)]
+pub struct PackedDomains {
+    buf: String,
+    ends: Vec<u32>,
+}
+
+impl PackedDomains {
+    pub fn len(&self) -> usize {
+        self.ends.len()
+    }
+
+    pub fn iter(&self) -> impl Iterator<Item = &str> + '_ {
+        let mut start = 0;
+        self.ends.iter().map(move |&end| {
+            let domain = &self.buf[start..end as usize];
+            start = end as usize;
+            domain
+        })
+    }
+}
+
+impl<'a> FromIterator<&'a str> for PackedDomains {
+    fn from_iter<I: IntoIterator<Item = &'a str>>(iter: I) -> Self {
+        let iter = iter.into_iter();
+        let mut packed = Self {
+            buf: String::new(),
+            ends: Vec::with_capacity(iter.size_hint().0),
+        };
+        for domain in iter {
+            packed.buf.push_str(domain);
+            let end = u32::try_from(packed.buf.len()).expect("packed domain list exceeds 4 GiB");
+            packed.ends.push(end);
+        }
+        packed.buf.shrink_to_fit();
+        packed
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn packed_domains_round_trip() {
+        let domains = ["a.com", "||b.com^", "sub.c.org"];
+        let packed: PackedDomains = domains.into_iter().collect();
+        assert_eq!(packed.len(), 3);
+        assert_eq!(packed.iter().collect::<Vec<_>>(), domains);
+    }
+
+    #[test]
+    fn packed_domains_empty() {
+        let packed: PackedDomains = std::iter::empty().collect();
+        assert_eq!(packed.len(), 0);
+        assert_eq!(packed.iter().count(), 0);
+    }
+}
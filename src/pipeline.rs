@@ -1,15 +1,24 @@
 use anyhow::{Context, Result};
-use futures::stream::{self, StreamExt};
+use bytes::Bytes;
+use futures::stream::{self, FuturesUnordered, StreamExt};
 use indicatif::{ProgressBar, ProgressStyle};
 use log::{debug, error, info, warn};
-use std::collections::{HashMap, HashSet};
-use std::io::Write;
-use std::path::Path;
+use sha2::{Digest, Sha256};
+use std::cmp::Reverse;
+use std::collections::{BinaryHeap, HashMap, HashSet};
+use std::fs::File;
+use std::io::{BufWriter, ErrorKind, Read, Write};
+use std::path::{Path, PathBuf};
+use std::sync::Arc;
 use std::time::Instant;
-
-use crate::client::HttpClient;
-use crate::config::{load_blocklists, AppConfig};
-use crate::domain::{extract_entry, format_num};
+use tokio::sync::{mpsc, Semaphore};
+use tokio::task::JoinHandle;
+use url::Url;
+
+use crate::client::{DownloadResult, HttpClient};
+use crate::config::{load_blocklists, AppConfig, Blocklist};
+use crate::domain::{detect_format, format_num, is_valid_entry, Entry, ListFormat};
+use crate::packed::PackedDomains;
 use crate::progress::ProgressTracker;
 use crate::whitelist::WhitelistManager;
 
@@ -37,8 +46,8 @@ impl BlocklistManager {
     pub async fn run(&mut self) -> Result<()> {
         let start = Instant::now();
 
-        let blocklists = load_blocklists(&self.config.config_file, &self.progress)?;
-        let categories: HashSet<String> = blocklists.iter().map(|b| b.category.clone()).collect();
+        let mut blocklists = load_blocklists(&self.config.config_file, &self.progress)?;
+        let categories: HashSet<&str> = blocklists.iter().map(|b| b.category.as_str()).collect();
         let total_lists = blocklists.len();
 
         if self.config.dry_run {
@@ -51,35 +60,39 @@ impl BlocklistManager {
 
         self.create_directories(&categories)?;
 
-        let mut category_domains: HashMap<String, HashSet<String>> = HashMap::new();
+        let mut category_domains: CategoryDomains = HashMap::new();
         let mut successful = 0usize;
         let mut skipped = 0usize;
         let mut failed = 0usize;
 
         if self.config.skip_download {
             info!("Skipping downloads, loading existing files...");
-            for bl in &blocklists {
-                let path = Path::new(&self.config.base_dir)
-                    .join(&bl.category)
-                    .join(format!("{}.txt", bl.name));
-                if path.exists() {
-                    match load_domains_from_file(&path, bl.allow_wildcards) {
-                        Ok(domains) => {
-                            debug!("  {}: {} domains (from file)", bl.name, domains.len());
-                            category_domains
-                                .entry(bl.category.clone())
-                                .or_default()
-                                .extend(domains);
-                            successful += 1;
-                        }
-                        Err(e) => {
-                            warn!("  {}: Failed to load - {e}", bl.name);
-                            failed += 1;
-                        }
+            // Each file is parsed on the blocking pool so lists load side by side
+            let workers = std::thread::available_parallelism().map_or(1, |n| n.get());
+            let base_dir = &self.config.base_dir;
+            let loaded: Vec<_> = stream::iter(&blocklists)
+                .map(|bl| load_local_domains(optimized_path(base_dir, bl), bl.allow_wildcards))
+                .buffered(workers)
+                .collect()
+                .await;
+            for (bl, loaded) in blocklists.iter().zip(loaded) {
+                match loaded {
+                    Ok(Some(domains)) => {
+                        debug!("  {}: {} domains (from file)", bl.name, domains.len());
+                        category_domains
+                            .entry(bl.category.clone())
+                            .or_default()
+                            .push(domains);
+                        successful += 1;
+                    }
+                    Ok(None) => {
+                        warn!("  {}: No local file found", bl.name);
+                        failed += 1;
+                    }
+                    Err(e) => {
+                        warn!("  {}: Failed to load - {e}", bl.name);
+                        failed += 1;
                     }
-                } else {
-                    warn!("  {}: No local file found", bl.name);
-                    failed += 1;
                 }
             }
         } else {
@@ -105,34 +118,94 @@ impl BlocklistManager {
 
             let client = self.http_client.clone();
             let incremental = self.config.incremental;
-
-            let results: Vec<_> = stream::iter(blocklists.clone())
+            let sort_per_list = self.config.sort_per_list;
+
+            let base_dir = self.config.base_dir.clone();
+
+            // Lists from the same host go out back to back so their requests
+            // reuse pooled connections instead of each paying for a handshake.
+            blocklists.sort_by_cached_key(|bl| url_host(&bl.url));
+
+            // Every list gets its own task up front; semaphores cap the requests in
+            // flight overall and per host, so a list waiting on a busy host never
+            // holds a slot another host could use
+            let slots = Arc::new(Semaphore::new(self.config.threads));
+            let max_per_host = self.config.max_per_host;
+            let mut host_slots: HashMap<Option<String>, Arc<Semaphore>> = HashMap::new();
+            let mut tasks: FuturesUnordered<_> = blocklists
+                .into_iter()
                 .map(|bl| {
                     let client = client.clone();
-                    async move {
+                    let slots = Arc::clone(&slots);
+                    let host_slots = Arc::clone(
+                        host_slots
+                            .entry(url_host(&bl.url))
+                            .or_insert_with(|| Arc::new(Semaphore::new(max_per_host))),
+                    );
+                    let opt_path = optimized_path(&base_dir, &bl);
+                    let raw_path = opt_path.with_extension("txt.raw");
+                    // Spawned so each list's network I/O and bookkeeping run on
+                    // their own runtime worker rather than all lists sharing this
+                    // task; the disk writes and parsing go to the blocking pool
+                    tokio::spawn(async move {
+                        let host_permit = host_slots
+                            .acquire_owned()
+                            .await
+                            .expect("host semaphore is never closed");
+                        let permit = slots
+                            .acquire_owned()
+                            .await
+                            .expect("download semaphore is never closed");
+
+                        // A not-modified answer is only usable with a local copy
+                        // to reload, so validators are sent only when one exists
+                        let conditional =
+                            incremental && tokio::fs::try_exists(&opt_path).await.unwrap_or(false);
+                        let sink = BodySink::new(raw_path);
                         let result = client
                             .download(
                                 &bl.url,
-                                if incremental {
+                                if conditional {
                                     bl.etag.as_deref()
                                 } else {
                                     None
                                 },
-                                if incremental {
+                                if conditional {
                                     bl.last_modified.as_deref()
                                 } else {
                                     None
                                 },
+                                |chunk| sink.write(chunk),
                             )
                             .await;
+                        drop((permit, host_permit));
+
+                        let result = match result {
+                            Ok(dl) => collect_domains(
+                                &bl,
+                                &dl,
+                                sink,
+                                opt_path,
+                                incremental,
+                                sort_per_list,
+                            )
+                            .await
+                            .map(|fetched| (dl, fetched)),
+                            Err(e) => {
+                                sink.discard().await;
+                                Err(e)
+                            }
+                        };
                         (bl, result)
-                    }
+                    })
                 })
-                .buffer_unordered(self.config.threads)
-                .collect()
-                .await;
+                .collect();
 
-            for (bl, result) in results {
+            // Handle each list as soon as its task ends, so progress is saved and
+            // the bar moves during the run, and a finished task is freed at once
+            // instead of waiting in a results vector for the slowest download
+            while let Some(joined) = tasks.next().await {
+                let (bl, result) = joined.context("Download task failed")?;
                 pb.inc(1);
 
                 match result {
@@ -140,84 +213,62 @@ impl BlocklistManager {
                         error!("  {}: {e}", bl.name);
                         failed += 1;
                     }
-                    Ok(dl) if !dl.was_modified => {
-                        debug!("  {}: Not modified (skipped)", bl.name);
-                        skipped += 1;
-
-                        // Load existing local file for production list generation
-                        let path = Path::new(&self.config.base_dir)
-                            .join(&bl.category)
-                            .join(format!("{}.txt", bl.name));
-                        if path.exists() {
-                            if let Ok(domains) = load_domains_from_file(&path, bl.allow_wildcards) {
-                                category_domains
-                                    .entry(bl.category.clone())
-                                    .or_default()
-                                    .extend(domains);
+                    Ok((dl, fetched)) => {
+                        let count = fetched.domains.len();
+
+                        if !fetched.changed {
+                            if dl.was_modified {
+                                debug!("  {}: Content unchanged (skipped)", bl.name);
+                            } else {
+                                debug!("  {}: Not modified (skipped)", bl.name);
                             }
-                        }
-                    }
-                    Ok(dl) => {
-                        let content = dl.content.expect("modified response must have content");
-                        let domains = process_content(&content, bl.allow_wildcards);
-                        let count = domains.len();
-
-                        if count == 0 {
-                            warn!("  {}: No valid domains extracted", bl.name);
-                        }
-
-                        // Save raw file
-                        let cat_dir = Path::new(&self.config.base_dir).join(&bl.category);
-                        let raw_path = cat_dir.join(format!("{}.txt.raw", bl.name));
-                        if let Err(e) = std::fs::write(&raw_path, &content) {
-                            warn!("Failed to write raw file for {}: {e}", bl.name);
-                        }
-
-                        // Save optimized file
-                        let opt_path = cat_dir.join(format!("{}.txt", bl.name));
-                        if let Err(e) = write_blocklist_file(&opt_path, &domains, None, false) {
-                            warn!("Failed to write optimized file for {}: {e}", bl.name);
+                            skipped += 1;
+                        } else {
+                            if count == 0 {
+                                warn!("  {}: No valid domains extracted", bl.name);
+                            }
+                            successful += 1;
+                            debug!("  {}: {count} domains", bl.name);
                         }
 
-                        // Update progress tracker
+                        // Update progress tracker. A not-modified answer keeps the
+                        // stored digest but may carry refreshed validators.
                         self.progress.update(
                             &bl.name,
                             dl.etag.as_deref(),
                             dl.last_modified.as_deref(),
                             count,
+                            fetched.digest.as_deref().or(bl.content_sha256.as_deref()),
                         );
 
                         category_domains
                             .entry(bl.category.clone())
                             .or_default()
-                            .extend(domains);
-                        successful += 1;
-
-                        debug!("  {}: {count} domains", bl.name);
+                            .push(fetched.domains);
                     }
                 }
             }
 
             pb.finish_and_clear();
+            self.progress.flush();
         }
 
-        // Compute unique domain count (excluding NSFW)
-        let unique_domains = {
-            let mut all: HashSet<&String> = HashSet::new();
-            for (cat, domains) in &category_domains {
-                if cat != "nsfw" {
-                    all.extend(domains);
-                }
-            }
-            all.len()
-        };
-
+        let unique_domains;
         let mut whitelisted = 0usize;
-        let mut final_domains = unique_domains;
+        let final_domains;
+
+        if self.config.skip_optimize {
+            // Only the count is needed, so nothing gets sorted
+            unique_domains = count_unique_domains(&category_domains);
+            final_domains = unique_domains;
+        } else {
+            // Sort each category once and merge the non-NSFW ones into the master
+            // list; the unique count, the master and the category outputs all share them
+            let sorted_categories = sort_categories(&category_domains);
+            let all_domains = merge_domains(&sorted_categories);
+            unique_domains = all_domains.len();
 
-        // Create production lists
-        if !self.config.skip_optimize {
-            let (w, f) = self.create_production_lists(&category_domains)?;
+            let (w, f) = self.create_production_lists(sorted_categories, all_domains)?;
             whitelisted = w;
             final_domains = f;
         }
@@ -247,45 +298,54 @@ impl BlocklistManager {
         Ok(())
     }
 
-    fn create_directories(&self, categories: &HashSet<String>) -> Result<()> {
-        std::fs::create_dir_all(&self.config.base_dir)?;
-        for cat in categories {
-            std::fs::create_dir_all(Path::new(&self.config.base_dir).join(cat))?;
+    fn create_directories(&self, categories: &HashSet<&str>) -> Result<()> {
+        // create_dir_all makes missing parents itself, so only the leaf
+        // directories are listed, each once
+        let base_dir = Path::new(&self.config.base_dir);
+        let mut needed: HashSet<PathBuf> =
+            categories.iter().map(|cat| base_dir.join(cat)).collect();
+        if needed.is_empty() {
+            needed.insert(base_dir.to_path_buf());
+        }
+        needed.insert(PathBuf::from(&self.config.prod_dir));
+
+        for dir in &needed {
+            std::fs::create_dir_all(dir)?;
         }
-        std::fs::create_dir_all(&self.config.prod_dir)?;
         Ok(())
     }
 
     fn create_production_lists(
         &self,
-        category_domains: &HashMap<String, HashSet<String>>,
+        sorted_categories: Vec<(&str, Vec<&str>)>,
+        mut all_domains: Vec<&str>,
     ) -> Result<(usize, usize)> {
         info!("Creating production blocklists...");
 
-        // Combine all non-NSFW domains
-        let mut all_domains: HashSet<String> = HashSet::new();
-        for (cat, domains) in category_domains {
-            if cat != "nsfw" {
-                all_domains.extend(domains.iter().cloned());
-            }
-        }
-
         // Apply whitelist filtering
         info!("Applying whitelist filtering...");
-        let (filtered, removed) = self.whitelist.filter_domains(&all_domains);
+        let removed = self.whitelist.filter_domains(&all_domains);
+        all_domains.retain(|d| !removed.contains_key(*d));
 
         // Write master file
         let master_path = Path::new(&self.config.prod_dir).join("all_domains.txt");
-        write_blocklist_file(&master_path, &filtered, Some("Master"), false)?;
+        write_blocklist_file(&master_path, &all_domains, Some("Master"), false)?;
         info!(
             "Created Master blocklist: {} domains",
-            format_num(filtered.len())
+            format_num(all_domains.len())
         );
 
         // Write per-category files
-        for (cat, domains) in category_domains {
-            if !domains.is_empty() {
-                let (cat_filtered, _) = self.whitelist.filter_domains(domains);
+        for (cat, mut cat_filtered) in sorted_categories {
+            if !cat_filtered.is_empty() {
+                // Categories in the master list were filtered with it; only the
+                // excluded category still needs its own whitelist pass
+                if cat == MASTER_EXCLUDED_CATEGORY {
+                    let cat_removed = self.whitelist.filter_domains(&cat_filtered);
+                    cat_filtered.retain(|d| !cat_removed.contains_key(*d));
+                } else {
+                    cat_filtered.retain(|d| !removed.contains_key(*d));
+                }
                 let cat_path = Path::new(&self.config.prod_dir).join(format!("{cat}.txt"));
                 let label = capitalize(cat);
                 write_blocklist_file(&cat_path, &cat_filtered, Some(&label), false)?;
@@ -312,84 +372,495 @@ impl BlocklistManager {
         }
 
         // Whitelist report
-        if self.config.whitelist_report && removed > 0 {
-            let removed_set: HashSet<String> = all_domains.difference(&filtered).cloned().collect();
+        if self.config.whitelist_report && !removed.is_empty() {
             let report_path = Path::new(&self.config.prod_dir).join("whitelist_report.txt");
             self.whitelist.generate_report(
                 report_path
                     .to_str()
                     .expect("report path must be valid UTF-8"),
-                &removed_set,
+                &removed,
             )?;
         }
 
-        Ok((removed, filtered.len()))
+        Ok((removed.len(), all_domains.len()))
     }
 }
 
-fn process_content(content: &[u8], allow_wildcards: bool) -> HashSet<String> {
-    let text = String::from_utf8_lossy(content);
-    let mut domains = HashSet::new();
-    for line in text.lines() {
-        if let Some(entry) = extract_entry(line, allow_wildcards) {
-            domains.insert(entry.to_key());
+/// Category kept out of `all_domains.txt`.
+const MASTER_EXCLUDED_CATEGORY: &str = "nsfw";
+
+/// Every list's domains, packed and grouped by category. A domain listed by
+/// several sources appears once per list until the category is sorted.
+type CategoryDomains = HashMap<String, Vec<PackedDomains>>;
+
+/// A list's parsed domains. Millions of short keys get hashed on the parse and
+/// union paths, where aHash is several times faster than the default SipHash
+/// and still randomly seeded.
+type DomainSet = HashSet<String, ahash::RandomState>;
+
+/// Count the distinct non-NSFW domains without sorting.
+fn count_unique_domains(category_domains: &CategoryDomains) -> usize {
+    let lists: Vec<&PackedDomains> = category_domains
+        .iter()
+        .filter(|(cat, _)| cat.as_str() != MASTER_EXCLUDED_CATEGORY)
+        .flat_map(|(_, lists)| lists)
+        .collect();
+    // Sized for the largest list up front: the union is at least that big, and
+    // lists overlap too heavily for their sum to be a useful estimate
+    let mut seen: HashSet<&str, ahash::RandomState> = HashSet::with_capacity_and_hasher(
+        lists.iter().map(|list| list.len()).max().unwrap_or(0),
+        Default::default(),
+    );
+    for list in lists {
+        seen.extend(list.iter());
+    }
+    seen.len()
+}
+
+/// Borrow each category's domains in sorted, deduplicated order, categories
+/// ordered by name.
+fn sort_categories(category_domains: &CategoryDomains) -> Vec<(&str, Vec<&str>)> {
+    let mut sorted: Vec<(&str, Vec<&str>)> = category_domains
+        .iter()
+        .map(|(cat, lists)| {
+            let mut domains: Vec<&str> =
+                Vec::with_capacity(lists.iter().map(PackedDomains::len).sum());
+            domains.extend(lists.iter().flat_map(PackedDomains::iter));
+            // Equal entries are identical strings, so a stable sort buys nothing
+            domains.sort_unstable();
+            domains.dedup();
+            (cat.as_str(), domains)
+        })
+        .collect();
+    sorted.sort_unstable_by_key(|(cat, _)| *cat);
+    sorted
+}
+
+/// Combine all non-NSFW categories into one sorted, deduplicated list with a
+/// k-way merge of their already-sorted domains, so no combined set is hashed
+/// and nothing is sorted twice.
+fn merge_domains<'a>(sorted_categories: &[(&str, Vec<&'a str>)]) -> Vec<&'a str> {
+    let lists: Vec<&[&'a str]> = sorted_categories
+        .iter()
+        .filter(|(cat, _)| *cat != MASTER_EXCLUDED_CATEGORY)
+        .map(|(_, domains)| domains.as_slice())
+        .collect();
+    let largest = lists.iter().map(|l| l.len()).max().unwrap_or(0);
+
+    let mut cursors = vec![0usize; lists.len()];
+    let mut heap: BinaryHeap<Reverse<(&str, usize)>> = lists
+        .iter()
+        .enumerate()
+        .filter_map(|(i, list)| list.first().map(|d| Reverse((*d, i))))
+        .collect();
+
+    let mut all_domains = Vec::with_capacity(largest);
+    while let Some(Reverse((domain, i))) = heap.pop() {
+        if all_domains.last() != Some(&domain) {
+            all_domains.push(domain);
+        }
+        cursors[i] += 1;
+        if let Some(next) = lists[i].get(cursors[i]) {
+            heap.push(Reverse((next, i)));
         }
     }
+    all_domains
+}
+
+fn url_host(url: &str) -> Option<String> {
+    Url::parse(url).ok()?.host_str().map(str::to_owned)
+}
+
+/// Raw files are parsed back from disk this many bytes at a time.
+const READ_BUFFER_SIZE: usize = 256 * 1024;
+
+/// Output files are written through a buffer this large.
+const WRITE_BUFFER_SIZE: usize = 1024 * 1024;
+
+/// Body chunks a download may run ahead of its raw-file writer.
+const BODY_CHANNEL_CHUNKS: usize = 32;
+
+/// Sniff the list format from the leading lines of `content`.
+fn sniff_format(content: &[u8]) -> ListFormat {
+    detect_format(
+        content
+            .split(|&b| b == b'\n')
+            .filter_map(|line| std::str::from_utf8(line).ok()),
+    )
+}
+
+/// Parse newline-separated raw bytes, decoding each line only as far as needed.
+#[cfg(test)]
+fn parse_lines(content: &[u8], format: ListFormat, allow_wildcards: bool) -> DomainSet {
+    let mut domains = DomainSet::default();
+    parse_lines_into(content, format, allow_wildcards, &mut domains);
     domains
 }
 
-fn load_domains_from_file(path: &Path, allow_wildcards: bool) -> Result<HashSet<String>> {
-    let content =
-        std::fs::read(path).with_context(|| format!("Failed to read {}", path.display()))?;
-    Ok(process_content(&content, allow_wildcards))
+fn parse_lines_into(
+    content: &[u8],
+    format: ListFormat,
+    allow_wildcards: bool,
+    domains: &mut DomainSet,
+) {
+    let mut start = 0;
+    for end in memchr::memchr_iter(b'\n', content).chain(std::iter::once(content.len())) {
+        // Blank and comment lines are dropped on the raw bytes, before decoding.
+        let raw = content[start..end].trim_ascii_start();
+        if !matches!(raw.first(), None | Some(b'#' | b'!')) {
+            let line = String::from_utf8_lossy(raw);
+            insert_entry(&line, format, allow_wildcards, domains);
+        }
+        start = end + 1;
+    }
+}
+
+/// Incremental line parser for content that arrives in arbitrary chunks.
+/// A line split across chunks is held back until its newline shows up.
+/// The format is sniffed from the first complete lines that arrive.
+struct StreamParser {
+    allow_wildcards: bool,
+    format: Option<ListFormat>,
+    pending: Vec<u8>,
+    domains: DomainSet,
+}
+
+impl StreamParser {
+    fn new(allow_wildcards: bool) -> Self {
+        Self {
+            allow_wildcards,
+            format: None,
+            pending: Vec::new(),
+            domains: DomainSet::default(),
+        }
+    }
+
+    fn feed(&mut self, mut chunk: &[u8]) {
+        if !self.pending.is_empty() {
+            let Some(nl) = memchr::memchr(b'\n', chunk) else {
+                self.pending.extend_from_slice(chunk);
+                return;
+            };
+            let mut line = std::mem::take(&mut self.pending);
+            line.extend_from_slice(&chunk[..nl]);
+            self.parse(&line);
+            line.clear();
+            self.pending = line;
+            chunk = &chunk[nl + 1..];
+        }
+
+        match memchr::memrchr(b'\n', chunk) {
+            Some(nl) => {
+                self.parse(&chunk[..nl]);
+                self.pending.extend_from_slice(&chunk[nl + 1..]);
+            }
+            None => self.pending.extend_from_slice(chunk),
+        }
+    }
+
+    fn parse(&mut self, lines: &[u8]) {
+        let format = *self.format.get_or_insert_with(|| sniff_format(lines));
+        parse_lines_into(lines, format, self.allow_wildcards, &mut self.domains);
+    }
+
+    fn finish(mut self) -> DomainSet {
+        let pending = std::mem::take(&mut self.pending);
+        self.parse(&pending);
+        self.domains
+    }
 }
 
+/// Destination for a download body: the chunks go over a bounded channel to a
+/// blocking-pool thread that hashes them and streams them to the list's `.raw`
+/// file, so neither the hashing nor a slow disk ever stalls a runtime worker
+/// and the body is never held in memory. The file is written under a `.part`
+/// name and only renamed into place once the download completes.
+struct BodySink {
+    chunks: mpsc::Sender<Bytes>,
+    writer: JoinHandle<std::io::Result<(String, bool)>>,
+    raw_path: PathBuf,
+    part_path: PathBuf,
+}
+
+impl BodySink {
+    fn new(raw_path: PathBuf) -> Self {
+        let mut part_path = raw_path.clone().into_os_string();
+        part_path.push(".part");
+        let part_path = PathBuf::from(part_path);
+        let (chunks, rx) = mpsc::channel(BODY_CHANNEL_CHUNKS);
+        let writer = {
+            let part_path = part_path.clone();
+            tokio::task::spawn_blocking(move || write_body(&part_path, rx))
+        };
+        Self {
+            chunks,
+            writer,
+            raw_path,
+            part_path,
+        }
+    }
+
+    /// Queue a chunk, waiting while the writer is `BODY_CHANNEL_CHUNKS` behind.
+    /// After a write error the writer is gone and chunks are dropped; `finish`
+    /// reports the error.
+    async fn write(&self, chunk: Bytes) {
+        let _ = self.chunks.send(chunk).await;
+    }
+
+    /// Move the body into place. Returns the `.raw` path and the hex SHA-256
+    /// of the body.
+    async fn finish(self) -> std::io::Result<(PathBuf, String)> {
+        drop(self.chunks);
+        let saved = match self.writer.await {
+            Ok(Ok((digest, true))) => tokio::fs::rename(&self.part_path, &self.raw_path)
+                .await
+                .map(|()| digest),
+            // An empty body still leaves an (empty) raw file to parse
+            Ok(Ok((digest, false))) => tokio::fs::write(&self.raw_path, b"").await.map(|()| digest),
+            Ok(Err(e)) => Err(e),
+            Err(e) => Err(std::io::Error::other(e)),
+        };
+        match saved {
+            Ok(digest) => Ok((self.raw_path, digest)),
+            Err(e) => {
+                let _ = tokio::fs::remove_file(&self.part_path).await;
+                Err(e)
+            }
+        }
+    }
+
+    async fn discard(self) {
+        drop(self.chunks);
+        // Nothing is on disk unless a body started arriving
+        if !matches!(self.writer.await, Ok(Ok((_, false)))) {
+            let _ = tokio::fs::remove_file(&self.part_path).await;
+        }
+    }
+}
+
+/// Hash and write the chunks of one body until the sender is dropped.
+/// Returns the hex SHA-256 of everything received, and whether any chunk
+/// arrived (the file is only created on the first one, so a 304 never
+/// touches the disk).
+fn write_body(path: &Path, mut chunks: mpsc::Receiver<Bytes>) -> std::io::Result<(String, bool)> {
+    let mut digest = Sha256::new();
+    let mut raw = None;
+    while let Some(chunk) = chunks.blocking_recv() {
+        digest.update(&chunk);
+        let raw = match &mut raw {
+            Some(raw) => raw,
+            None => raw.insert(BufWriter::new(File::create(path)?)),
+        };
+        raw.write_all(&chunk)?;
+    }
+    let written = match raw {
+        Some(mut raw) => {
+            raw.flush()?;
+            true
+        }
+        None => false,
+    };
+    Ok((format!("{:x}", digest.finalize()), written))
+}
+
+/// What a download task hands back for one list.
+struct FetchedList {
+    domains: PackedDomains,
+    /// Hex SHA-256 of the body, when one was received.
+    digest: Option<String>,
+    /// Whether the content differs from the optimized copy on disk.
+    changed: bool,
+}
+
+/// Turn a finished download into the list's domains. New content is parsed
+/// from the `.raw` file and written out as the optimized copy; a 304, or a
+/// body whose digest matches the last run, reuses that copy instead.
+async fn collect_domains(
+    bl: &Blocklist,
+    dl: &DownloadResult,
+    sink: BodySink,
+    opt_path: PathBuf,
+    incremental: bool,
+    sort_per_list: bool,
+) -> Result<FetchedList> {
+    let allow_wildcards = bl.allow_wildcards;
+
+    if !dl.was_modified {
+        sink.discard().await;
+        let domains = load_local_domains(opt_path, allow_wildcards)
+            .await?
+            .with_context(|| format!("Optimized copy of {} is missing", bl.name))?;
+        return Ok(FetchedList {
+            domains,
+            digest: None,
+            changed: false,
+        });
+    }
+
+    let (raw_path, digest) = sink
+        .finish()
+        .await
+        .with_context(|| format!("Failed to write raw file for {}", bl.name))?;
+
+    // Servers without ETag/Last-Modified resend identical bodies
+    if incremental && bl.content_sha256.as_deref() == Some(digest.as_str()) {
+        if let Ok(Some(domains)) = load_local_domains(opt_path.clone(), allow_wildcards).await {
+            return Ok(FetchedList {
+                domains,
+                digest: Some(digest),
+                changed: false,
+            });
+        }
+    }
+
+    // Parsing and writing the optimized copy both happen on the blocking pool,
+    // so lists finishing together are processed side by side and none of it
+    // stalls the runtime or the result loop. Only the production lists need a
+    // stable order, so the per-list copy is sorted on request only.
+    let name = bl.name.clone();
+    let domains = tokio::task::spawn_blocking(move || {
+        let domains = parse_file(&raw_path, allow_wildcards)?;
+        let keys = if sort_per_list {
+            sorted_keys(&domains)
+        } else {
+            domains.iter().map(String::as_str).collect()
+        };
+        if let Err(e) = write_blocklist_file(&opt_path, &keys, None, false) {
+            warn!("Failed to write optimized file for {name}: {e}");
+        }
+        Ok::<_, anyhow::Error>(pack(&domains))
+    })
+    .await
+    .context("Parse task failed")??;
+    Ok(FetchedList {
+        domains,
+        digest: Some(digest),
+        changed: true,
+    })
+}
+
+/// Parse a file a buffer at a time, so memory stays bounded however large
+/// the list is.
+fn parse_file(path: &Path, allow_wildcards: bool) -> Result<DomainSet> {
+    let mut file =
+        File::open(path).with_context(|| format!("Failed to open {}", path.display()))?;
+    let mut parser = StreamParser::new(allow_wildcards);
+    let mut buf = vec![0u8; READ_BUFFER_SIZE];
+    loop {
+        match file.read(&mut buf) {
+            Ok(0) => break,
+            Ok(n) => parser.feed(&buf[..n]),
+            Err(e) if e.kind() == ErrorKind::Interrupted => continue,
+            Err(e) => return Err(e).with_context(|| format!("Failed to read {}", path.display())),
+        }
+    }
+    Ok(parser.finish())
+}
+
+/// Add the entry on `line` to `domains`. A key already in the set was validated
+/// when it was first inserted, so repeats skip validation.
+fn insert_entry(line: &str, format: ListFormat, allow_wildcards: bool, domains: &mut DomainSet) {
+    let Some((raw, wildcard)) = format.split_entry(line, allow_wildcards) else {
+        return;
+    };
+    // One allocation per line: the normalized domain becomes the key in place
+    let key = Entry::new(raw, wildcard).into_key();
+    if domains.contains(&key) {
+        return;
+    }
+    let domain = if wildcard {
+        &key[2..key.len() - 1]
+    } else {
+        &key
+    };
+    if is_valid_entry(domain) {
+        domains.insert(key);
+    }
+}
+
+/// Where a list's optimized copy lives under `base_dir`.
+fn optimized_path(base_dir: &str, bl: &Blocklist) -> PathBuf {
+    Path::new(base_dir)
+        .join(&bl.category)
+        .join(format!("{}.txt", bl.name))
+}
+
+/// Parse and pack a previously written list on the blocking pool. `None` if
+/// the file doesn't exist. Each load streams its file on a single thread, so
+/// concurrent loads never hold whole files or multiply threads.
+async fn load_local_domains(path: PathBuf, allow_wildcards: bool) -> Result<Option<PackedDomains>> {
+    tokio::task::spawn_blocking(move || {
+        if !path.exists() {
+            return Ok(None);
+        }
+        parse_file(&path, allow_wildcards).map(|domains| Some(pack(&domains)))
+    })
+    .await
+    .context("File load task failed")?
+}
+
+fn pack(domains: &DomainSet) -> PackedDomains {
+    domains.iter().map(String::as_str).collect()
+}
+
+/// Borrow the keys of `domains` in sorted order.
+fn sorted_keys(domains: &DomainSet) -> Vec<&str> {
+    let mut sorted: Vec<&str> = domains.iter().map(String::as_str).collect();
+    sorted.sort_unstable();
+    sorted
+}
+
+/// Write `domains`, in the order given, as a Pi-hole blocklist.
 fn write_blocklist_file(
     path: &Path,
-    domains: &HashSet<String>,
+    domains: &[&str],
     label: Option<&str>,
     force_abp: bool,
 ) -> Result<()> {
-    let mut sorted: Vec<&String> = domains.iter().collect();
-    sorted.sort();
-
     let file = std::fs::File::create(path)
         .with_context(|| format!("Failed to create {}", path.display()))?;
-    let mut w = std::io::BufWriter::new(file);
+    let mut w = std::io::BufWriter::with_capacity(WRITE_BUFFER_SIZE, file);
 
     let label = label.unwrap_or("Optimized");
     let now = chrono::Local::now().format("%Y-%m-%d %H:%M:%S");
 
     writeln!(w, "# Pi-hole {label} Blocklist")?;
     writeln!(w, "# Last updated: {now}")?;
-    writeln!(w, "# Total domains: {}", sorted.len())?;
+    writeln!(w, "# Total domains: {}", domains.len())?;
     writeln!(w)?;
 
-    for domain in sorted {
-        let line = if force_abp {
-            format_abp_line(domain)
+    // Each line goes out as borrowed pieces: no per-domain String or format machinery
+    for domain in domains {
+        let (prefix, key, suffix) = if force_abp {
+            abp_line_parts(domain)
         } else {
-            format_blocklist_line(domain)
+            blocklist_line_parts(domain)
         };
-        writeln!(w, "{line}")?;
+        w.write_all(prefix.as_bytes())?;
+        w.write_all(key.as_bytes())?;
+        w.write_all(suffix.as_bytes())?;
     }
 
+    w.flush()
+        .with_context(|| format!("Failed to write {}", path.display()))?;
     Ok(())
 }
 
-fn format_blocklist_line(key: &str) -> String {
+/// The pieces of a hosts-style output line, newline included.
+fn blocklist_line_parts(key: &str) -> (&'static str, &str, &'static str) {
     if key.starts_with("||") {
-        key.to_string()
+        ("", key, "\n")
     } else {
-        format!("0.0.0.0 {key}")
+        ("0.0.0.0 ", key, "\n")
     }
 }
 
-fn format_abp_line(key: &str) -> String {
+/// The pieces of an ABP-style output line, newline included.
+fn abp_line_parts(key: &str) -> (&'static str, &str, &'static str) {
     if key.starts_with("||") {
-        key.to_string()
+        ("", key, "\n")
     } else {
-        format!("||{key}^")
+        ("||", key, "^\n")
     }
 }
 
@@ -405,32 +876,137 @@ fn capitalize(s: &str) -> String {
 mod tests {
     use super::*;
 
+    fn parse_content(content: &[u8], allow_wildcards: bool) -> DomainSet {
+        let mut parser = StreamParser::new(allow_wildcards);
+        parser.feed(content);
+        parser.finish()
+    }
+
     #[test]
-    fn process_content_emits_wildcards_when_enabled() {
-        let set = process_content(b"||foo.com^\n*.bar.com\n0.0.0.0 baz.com\n", true);
+    fn parse_emits_wildcards_when_enabled() {
+        let set = parse_content(b"||foo.com^\n*.bar.com\n0.0.0.0 baz.com\n", true);
         assert!(set.contains("||foo.com^"));
         assert!(set.contains("||bar.com^"));
         assert!(set.contains("baz.com"));
     }
 
     #[test]
-    fn process_content_flattens_when_disabled() {
-        let set = process_content(b"||foo.com^\n*.bar.com\n", false);
+    fn parse_flattens_when_disabled() {
+        let set = parse_content(b"||foo.com^\n*.bar.com\n", false);
         assert!(set.contains("foo.com"));
         assert!(set.contains("bar.com"));
         assert!(!set.iter().any(|d| d.contains('*') || d.starts_with("||")));
     }
 
     #[test]
-    fn format_blocklist_line_handles_both_forms() {
-        assert_eq!(format_blocklist_line("foo.com"), "0.0.0.0 foo.com");
-        assert_eq!(format_blocklist_line("||foo.com^"), "||foo.com^");
+    fn parse_lines_handles_crlf_and_missing_trailing_newline() {
+        let set = parse_lines(b"0.0.0.0 a.com\r\n\r\nb.com", ListFormat::Mixed, false);
+        assert_eq!(set.len(), 2);
+        assert!(set.contains("a.com"));
+        assert!(set.contains("b.com"));
+    }
+
+    #[test]
+    fn insert_entry_dedupes_repeats_and_rejects_invalid() {
+        let mut set = DomainSet::default();
+        insert_entry(
+            "0.0.0.0 Ads.Example.com",
+            ListFormat::Mixed,
+            false,
+            &mut set,
+        );
+        insert_entry("ads.example.com.", ListFormat::Mixed, false, &mut set);
+        insert_entry("||ads.example.com^", ListFormat::Mixed, true, &mut set);
+        insert_entry("0.0.0.0 localhost", ListFormat::Mixed, false, &mut set);
+        assert_eq!(set.len(), 2);
+        assert!(set.contains("ads.example.com"));
+        assert!(set.contains("||ads.example.com^"));
+    }
+
+    #[test]
+    fn stream_parser_matches_whole_buffer_parse() {
+        let content: &[u8] = b"# header\n0.0.0.0 a.com\n||b.com^\nc.com # note\r\nd.com";
+        let expected = parse_lines(content, ListFormat::Mixed, true);
+        for size in 1..content.len() {
+            let mut parser = StreamParser::new(true);
+            for chunk in content.chunks(size) {
+                parser.feed(chunk);
+            }
+            assert_eq!(parser.finish(), expected, "chunk size {size}");
+        }
+    }
+
+    #[test]
+    fn parse_file_matches_whole_buffer_parse() {
+        let content: &[u8] = b"# header\n0.0.0.0 a.com\n||b.com^\nc.com # note\r\nd.com";
+        let path = std::env::temp_dir().join(format!(
+            "pihole-optimizer-{}-parse-file.raw",
+            std::process::id()
+        ));
+        std::fs::write(&path, content).unwrap();
+        let parsed = parse_file(&path, true).unwrap();
+        std::fs::remove_file(&path).unwrap();
+        assert_eq!(parsed, parse_lines(content, ListFormat::Mixed, true));
+    }
+
+    #[tokio::test]
+    async fn body_sink_writes_and_hashes_off_the_runtime() {
+        let path = std::env::temp_dir().join(format!(
+            "pihole-optimizer-{}-body-sink.raw",
+            std::process::id()
+        ));
+        let sink = BodySink::new(path.clone());
+        for chunk in ["a", "b", "c"] {
+            sink.write(Bytes::from_static(chunk.as_bytes())).await;
+        }
+        let (raw_path, digest) = sink.finish().await.unwrap();
+        assert_eq!(std::fs::read(&raw_path).unwrap(), b"abc");
+        std::fs::remove_file(&raw_path).unwrap();
+        assert_eq!(
+            digest,
+            "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+        );
+
+        // A discarded sink that never saw a chunk leaves nothing behind
+        BodySink::new(path.clone()).discard().await;
+        assert!(!path.with_extension("raw.part").exists());
+    }
+
+    #[test]
+    fn merge_domains_dedupes_across_categories_and_skips_nsfw() {
+        let mut categories: CategoryDomains = HashMap::new();
+        categories.insert(
+            "advertising".into(),
+            vec![["b.com", "a.com"].into_iter().collect()],
+        );
+        categories.insert(
+            "tracking".into(),
+            vec![
+                ["a.com", "c.com"].into_iter().collect(),
+                ["c.com"].into_iter().collect(),
+            ],
+        );
+        categories.insert("nsfw".into(), vec![["z.com"].into_iter().collect()]);
+        categories.insert("empty".into(), Vec::new());
+        let sorted = sort_categories(&categories);
+        assert_eq!(merge_domains(&sorted), ["a.com", "b.com", "c.com"]);
+        assert_eq!(count_unique_domains(&categories), 3);
+    }
+
+    fn render((prefix, key, suffix): (&str, &str, &str)) -> String {
+        format!("{prefix}{key}{suffix}")
+    }
+
+    #[test]
+    fn blocklist_line_parts_handles_both_forms() {
+        assert_eq!(render(blocklist_line_parts("foo.com")), "0.0.0.0 foo.com\n");
+        assert_eq!(render(blocklist_line_parts("||foo.com^")), "||foo.com^\n");
     }
 
     #[test]
-    fn format_abp_line_wraps_exact_and_keeps_wildcards() {
-        assert_eq!(format_abp_line("foo.com"), "||foo.com^");
-        assert_eq!(format_abp_line("sub.foo.com"), "||sub.foo.com^");
-        assert_eq!(format_abp_line("||foo.com^"), "||foo.com^");
+    fn abp_line_parts_wraps_exact_and_keeps_wildcards() {
+        assert_eq!(render(abp_line_parts("foo.com")), "||foo.com^\n");
+        assert_eq!(render(abp_line_parts("sub.foo.com")), "||sub.foo.com^\n");
+        assert_eq!(render(abp_line_parts("||foo.com^")), "||foo.com^\n");
     }
 }
@@ -1,46 +1,54 @@
 use serde::{Deserialize, Serialize};
-use std::collections::HashMap;
-use std::path::Path;
+use std::collections::BTreeMap;
+use std::fs::File;
+use std::io::{BufWriter, ErrorKind, Write};
 
 const PROGRESS_FILE: &str = "download_progress.json";
 
+/// Unsaved updates allowed to pile up before they are written out, so a crash
+/// part way through a long run loses at most this many.
+const CHECKPOINT_INTERVAL: usize = 50;
+
 #[derive(Debug, Clone, Serialize, Deserialize)]
 pub struct ProgressEntry {
     pub etag: Option<String>,
     pub last_modified: Option<String>,
     pub domain_count: usize,
     pub last_download: String,
+    #[serde(default)]
+    pub content_sha256: Option<String>,
 }
 
 pub struct ProgressTracker {
-    entries: HashMap<String, ProgressEntry>,
+    entries: BTreeMap<String, ProgressEntry>,
+    pending: usize,
 }
 
 impl ProgressTracker {
     pub fn load() -> Self {
-        let entries = if Path::new(PROGRESS_FILE).exists() {
-            match std::fs::read_to_string(PROGRESS_FILE) {
-                Ok(content) => match serde_json::from_str(&content) {
-                    Ok(map) => {
-                        let map: HashMap<String, ProgressEntry> = map;
-                        log::debug!("Loaded progress for {} lists", map.len());
-                        map
-                    }
-                    Err(e) => {
-                        log::warn!("Failed to parse progress file: {e}");
-                        HashMap::new()
-                    }
-                },
+        let entries = match std::fs::read(PROGRESS_FILE) {
+            Ok(content) => match serde_json::from_slice(&content) {
+                Ok(map) => {
+                    let map: BTreeMap<String, ProgressEntry> = map;
+                    log::debug!("Loaded progress for {} lists", map.len());
+                    map
+                }
                 Err(e) => {
-                    log::warn!("Failed to read progress file: {e}");
-                    HashMap::new()
+                    log::warn!("Failed to parse progress file: {e}");
+                    BTreeMap::new()
                 }
+            },
+            Err(e) if e.kind() == ErrorKind::NotFound => BTreeMap::new(),
+            Err(e) => {
+                log::warn!("Failed to read progress file: {e}");
+                BTreeMap::new()
             }
-        } else {
-            HashMap::new()
         };
 
-        Self { entries }
+        Self {
+            entries,
+            pending: 0,
+        }
     }
 
     pub fn get(&self, name: &str) -> Option<&ProgressEntry> {
@@ -53,6 +61,7 @@ impl ProgressTracker {
         etag: Option<&str>,
         last_modified: Option<&str>,
         domain_count: usize,
+        content_sha256: Option<&str>,
     ) {
         self.entries.insert(
             name.to_string(),
@@ -61,19 +70,40 @@ impl ProgressTracker {
                 last_modified: last_modified.map(String::from),
                 domain_count,
                 last_download: chrono::Local::now().to_rfc3339(),
+                content_sha256: content_sha256.map(String::from),
             },
         );
-        self.save();
+        self.pending += 1;
+        if self.pending >= CHECKPOINT_INTERVAL {
+            self.flush();
+        }
     }
 
-    fn save(&self) {
-        match serde_json::to_string_pretty(&self.entries) {
-            Ok(json) => {
-                if let Err(e) = std::fs::write(PROGRESS_FILE, json) {
-                    log::error!("Failed to save progress: {e}");
-                }
-            }
-            Err(e) => log::error!("Failed to serialize progress: {e}"),
+    /// Persist pending updates. The file is written to a temporary name and
+    /// renamed over the old one, so an interrupted save never truncates it.
+    pub fn flush(&mut self) {
+        if self.pending == 0 {
+            return;
         }
+        let tmp = format!("{PROGRESS_FILE}.tmp");
+        match write_json(&tmp, &self.entries).and_then(|_| std::fs::rename(&tmp, PROGRESS_FILE)) {
+            Ok(()) => self.pending = 0,
+            Err(e) => log::error!("Failed to save progress: {e}"),
+        }
+    }
+}
+
+/// Updates made before a run bails out with an error are still saved.
+impl Drop for ProgressTracker {
+    fn drop(&mut self) {
+        self.flush();
     }
 }
+
+/// Serialize straight into a buffered file rather than building the whole
+/// document in memory first.
+fn write_json(path: &str, entries: &BTreeMap<String, ProgressEntry>) -> std::io::Result<()> {
+    let mut w = BufWriter::new(File::create(path)?);
+    serde_json::to_writer_pretty(&mut w, entries)?;
+    w.flush()
+}
@@ -1,13 +1,183 @@
 use anyhow::Result;
 use log::{debug, info, warn};
-use regex::Regex;
-use std::collections::HashSet;
-use std::path::Path;
+use regex::{Regex, RegexBuilder, RegexSetBuilder};
+use std::collections::{HashMap, HashSet};
+use std::io::{ErrorKind, Write};
 
 use crate::domain::{normalize_domain, validate_domain};
 
+// The combined whitelist pattern is one large alternation. Raising the lazy DFA
+// cache keeps matching on the DFA even with many patterns instead of thrashing
+// the cache and falling back to the slower NFA simulation.
+const COMBINED_DFA_SIZE_LIMIT: usize = 64 * 1024 * 1024;
+const COMBINED_SIZE_LIMIT: usize = 64 * 1024 * 1024;
+
+const REPORT_SAMPLE_SIZE: usize = 100;
+
+const BLOOM_FALSE_POSITIVE_RATE: f64 = 1e-3;
+
+/// Exact whitelist domains and `*.domain` wildcards stored label by label from
+/// the TLD inward, so a subdomain check is one map lookup per label instead of
+/// a hash of every suffix, and those wildcards never reach the regex engine.
+#[derive(Default)]
+struct SuffixTrie {
+    children: HashMap<Box<str>, SuffixTrie>,
+    terminal: bool,
+    wildcard: bool,
+}
+
+impl SuffixTrie {
+    fn node_mut(&mut self, domain: &str) -> &mut SuffixTrie {
+        let mut node = self;
+        for label in domain.rsplit('.') {
+            node = node.children.entry(label.into()).or_default();
+        }
+        node
+    }
+
+    fn insert(&mut self, domain: &str) {
+        self.node_mut(domain).terminal = true;
+    }
+
+    /// Add a `*.domain` wildcard: it matches proper subdomains of `domain` only.
+    fn insert_wildcard(&mut self, domain: &str) {
+        self.node_mut(domain).wildcard = true;
+    }
+
+    /// How a proper parent of `domain` matched, if one did: `Subdomain` for an
+    /// exact entry (only when `subdomains` is set), otherwise `Pattern` for a
+    /// wildcard.
+    fn match_parents(&self, domain: &str, subdomains: bool) -> Option<MatchKind> {
+        let mut node = self;
+        let mut wildcard = false;
+        let mut labels = domain.rsplit('.').peekable();
+        while let Some(label) = labels.next() {
+            match node.children.get(label) {
+                Some(child) => node = child,
+                None => break,
+            }
+            if labels.peek().is_some() {
+                if subdomains && node.terminal {
+                    return Some(MatchKind::Subdomain);
+                }
+                wildcard |= node.wildcard;
+            }
+        }
+        wildcard.then_some(MatchKind::Pattern)
+    }
+}
+
+/// The domain behind a `*.domain` whitelist line, if it is plain enough for the
+/// suffix trie: at least two labels of letters, digits and hyphens. Anything
+/// else stays a regex.
+fn trie_wildcard(line: &str) -> Option<&str> {
+    let domain = line.strip_prefix("*.")?;
+    let labels_ok = domain.split('.').all(|label| {
+        !label.is_empty()
+            && label
+                .bytes()
+                .all(|b| b.is_ascii_alphanumeric() || b == b'-')
+    });
+    (labels_ok && domain.contains('.')).then_some(domain)
+}
+
+/// Bloom filter over the last two labels of every entry in the suffix trie. An
+/// exact, subdomain or trie wildcard match always shares those labels with
+/// some entry, so a miss rules them all out with one cheap hash, where the
+/// full lookups would hash the whole domain and walk the trie.
+struct BloomFilter {
+    bits: Vec<u64>,
+    mask: u64,
+    hashes: u32,
+}
+
+impl BloomFilter {
+    /// Size for `items` entries at `fp_rate`: m = -n ln p / ln² 2 bits, rounded
+    /// up to a power of two, and k = (m / n) ln 2 probes.
+    fn with_capacity(items: usize, fp_rate: f64) -> Self {
+        let n = items.max(1) as f64;
+        let ln2 = std::f64::consts::LN_2;
+        let bits = ((-n * fp_rate.ln() / (ln2 * ln2)).ceil() as u64)
+            .max(64)
+            .next_power_of_two();
+        let hashes = ((bits as f64 / n) * ln2).round().clamp(1.0, 16.0) as u32;
+        Self {
+            bits: vec![0; (bits / 64) as usize],
+            mask: bits - 1,
+            hashes,
+        }
+    }
+
+    /// Probe positions by double hashing, h1 + i * h2, over one 64-bit FNV-1a.
+    fn probes(&self, key: &str) -> impl Iterator<Item = u64> {
+        let hash = key.bytes().fold(0xcbf2_9ce4_8422_2325u64, |h, b| {
+            (h ^ u64::from(b)).wrapping_mul(0x0100_0000_01b3)
+        });
+        let (h1, h2) = (hash, hash.rotate_left(32) | 1);
+        let mask = self.mask;
+        (0..u64::from(self.hashes)).map(move |i| h1.wrapping_add(i.wrapping_mul(h2)) & mask)
+    }
+
+    fn insert(&mut self, key: &str) {
+        for bit in self.probes(key) {
+            self.bits[(bit / 64) as usize] |= 1 << (bit % 64);
+        }
+    }
+
+    fn may_contain(&self, key: &str) -> bool {
+        self.probes(key)
+            .all(|bit| self.bits[(bit / 64) as usize] & (1 << (bit % 64)) != 0)
+    }
+}
+
+fn build_pattern(pattern: &str) -> Result<Regex, regex::Error> {
+    RegexBuilder::new(pattern)
+        .size_limit(COMBINED_SIZE_LIMIT)
+        .dfa_size_limit(COMBINED_DFA_SIZE_LIMIT)
+        .build()
+}
+
+/// The last two labels of `domain` (all of it if it has fewer).
+fn base_suffix(domain: &str) -> &str {
+    match domain.rfind('.').and_then(|i| domain[..i].rfind('.')) {
+        Some(i) => &domain[i + 1..],
+        None => domain,
+    }
+}
+
+/// A wildcard or regex whitelist entry: how it appeared in the file and the
+/// regex it contributes to the combined pattern.
+struct PatternEntry {
+    label: String,
+    regex: String,
+    /// 1-based line in the whitelist file.
+    line: usize,
+    /// From a `*` wildcard line rather than a `/regex/` one.
+    wildcard: bool,
+    /// For a plain `*.domain` wildcard, the domain it is matched through in
+    /// the suffix trie instead of the combined regex.
+    trie_domain: Option<String>,
+}
+
+impl PatternEntry {
+    fn in_trie(&self) -> bool {
+        self.trie_domain.is_some()
+    }
+}
+
+/// Which kind of whitelist rule removed a domain.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum MatchKind {
+    Exact,
+    Subdomain,
+    Pattern,
+}
+
 pub struct WhitelistManager {
     exact_domains: HashSet<String>,
+    suffix_trie: SuffixTrie,
+    suffix_bloom: BloomFilter,
+    patterns: Vec<PatternEntry>,
     combined_pattern: Option<Regex>,
     enable_subdomain: bool,
 }
@@ -16,27 +186,29 @@ impl WhitelistManager {
     pub fn load(whitelist_file: &str, enable_subdomain: bool) -> Self {
         let mut manager = Self {
             exact_domains: HashSet::new(),
+            suffix_trie: SuffixTrie::default(),
+            suffix_bloom: BloomFilter::with_capacity(0, BLOOM_FALSE_POSITIVE_RATE),
+            patterns: Vec::new(),
             combined_pattern: None,
             enable_subdomain,
         };
 
-        if !Path::new(whitelist_file).exists() {
-            debug!("Whitelist file not found: {whitelist_file}");
-            return manager;
-        }
-
-        let content = match std::fs::read_to_string(whitelist_file) {
-            Ok(c) => c,
+        // Read raw bytes in one go: a stray non-UTF-8 byte only garbles its own
+        // line instead of failing the whole whitelist
+        let bytes = match std::fs::read(whitelist_file) {
+            Ok(b) => b,
+            Err(e) if e.kind() == ErrorKind::NotFound => {
+                debug!("Whitelist file not found: {whitelist_file}");
+                return manager;
+            }
             Err(e) => {
                 log::error!("Failed to load whitelist: {e}");
                 return manager;
             }
         };
+        let content = String::from_utf8_lossy(&bytes);
 
         let mut exact_count = 0usize;
-        let mut wildcard_count = 0usize;
-        let mut regex_count = 0usize;
-        let mut all_patterns: Vec<String> = Vec::new();
 
         for (line_num, line) in content.lines().enumerate() {
             let line = if let Some(pos) = line.find('#') {
@@ -52,10 +224,15 @@ impl WhitelistManager {
             // Regex pattern: /pattern/
             if line.starts_with('/') && line.ends_with('/') && line.len() > 2 {
                 let pattern = &line[1..line.len() - 1];
-                match Regex::new(pattern) {
+                match regex_syntax::parse(pattern) {
                     Ok(_) => {
-                        all_patterns.push(format!("(?:{pattern})"));
-                        regex_count += 1;
+                        manager.patterns.push(PatternEntry {
+                            label: format!("{line} (regex)"),
+                            regex: pattern.to_string(),
+                            line: line_num + 1,
+                            wildcard: false,
+                            trie_domain: None,
+                        });
                     }
                     Err(e) => {
                         warn!("Invalid regex on line {}: {pattern} - {e}", line_num + 1);
@@ -67,10 +244,15 @@ impl WhitelistManager {
             // Wildcard pattern: contains *
             if line.contains('*') {
                 let regex_pattern = format!("^{}$", line.replace('.', r"\.").replace('*', ".*"));
-                match Regex::new(&regex_pattern) {
+                match regex_syntax::parse(&regex_pattern) {
                     Ok(_) => {
-                        all_patterns.push(format!("(?:{regex_pattern})"));
-                        wildcard_count += 1;
+                        manager.patterns.push(PatternEntry {
+                            label: format!("{line} (wildcard)"),
+                            regex: regex_pattern,
+                            line: line_num + 1,
+                            wildcard: true,
+                            trie_domain: trie_wildcard(line).map(String::from),
+                        });
                     }
                     Err(e) => {
                         warn!("Invalid wildcard on line {}: {line} - {e}", line_num + 1);
@@ -79,22 +261,69 @@ impl WhitelistManager {
                 continue;
             }
 
-            // Exact domain
+            // Exact domain (repeats were validated the first time round)
             let domain = normalize_domain(line);
+            if manager.exact_domains.contains(&domain) {
+                continue;
+            }
             if validate_domain(&domain) {
                 manager.exact_domains.insert(domain);
                 exact_count += 1;
             }
         }
 
-        // Build combined regex for wildcard and regex patterns
-        if !all_patterns.is_empty() {
-            match Regex::new(&all_patterns.join("|")) {
-                Ok(re) => manager.combined_pattern = Some(re),
-                Err(_) => warn!("Failed to compile combined whitelist pattern"),
-            }
+        // The trie's wildcards keep their PatternEntry so the report can still
+        // attribute matches to them
+        let wildcards: Vec<&str> = manager
+            .patterns
+            .iter()
+            .filter_map(|p| p.trie_domain.as_deref())
+            .collect();
+
+        manager.suffix_bloom = BloomFilter::with_capacity(
+            manager.exact_domains.len() + wildcards.len(),
+            BLOOM_FALSE_POSITIVE_RATE,
+        );
+        for domain in &manager.exact_domains {
+            manager.suffix_trie.insert(domain);
+            manager.suffix_bloom.insert(base_suffix(domain));
+        }
+        for domain in wildcards {
+            manager.suffix_trie.insert_wildcard(domain);
+            manager.suffix_bloom.insert(base_suffix(domain));
         }
 
+        // Build combined regex for the remaining wildcard and regex patterns.
+        // Each entry above was only syntax-checked; this is the one real
+        // compilation.
+        manager.combined_pattern = match manager.build_combined() {
+            Ok(re) => re,
+            Err(e) => {
+                // Find the entries that break the size limits, so one bad line
+                // costs only itself rather than every pattern
+                warn!("Failed to compile combined whitelist pattern: {e}");
+                manager.patterns.retain(|p| {
+                    p.in_trie()
+                        || match build_pattern(&p.regex) {
+                            Ok(_) => true,
+                            Err(e) => {
+                                warn!(
+                                    "Invalid whitelist pattern on line {}: {} - {e}",
+                                    p.line, p.label
+                                );
+                                false
+                            }
+                        }
+                });
+                manager.build_combined().unwrap_or_else(|e| {
+                    warn!("Failed to compile combined whitelist pattern: {e}");
+                    None
+                })
+            }
+        };
+
+        let wildcard_count = manager.patterns.iter().filter(|p| p.wildcard).count();
+        let regex_count = manager.patterns.len() - wildcard_count;
         let total = exact_count + wildcard_count + regex_count;
         if total > 0 {
             info!(
@@ -106,68 +335,114 @@ impl WhitelistManager {
         manager
     }
 
-    /// Check if domain is a subdomain of any whitelisted exact domain.
-    /// Zero-allocation: iterates through dot positions and checks suffixes.
-    fn check_subdomain(&self, domain: &str) -> bool {
-        let mut start = 0;
-        while let Some(dot_pos) = domain[start..].find('.') {
-            start += dot_pos + 1;
-            if self.exact_domains.contains(&domain[start..]) {
-                return true;
-            }
+    /// Compile every pattern the suffix trie doesn't cover into one regex.
+    fn build_combined(&self) -> Result<Option<Regex>, regex::Error> {
+        let all_patterns: Vec<String> = self
+            .patterns
+            .iter()
+            .filter(|p| !p.in_trie())
+            .map(|p| format!("(?:{})", p.regex))
+            .collect();
+        if all_patterns.is_empty() {
+            return Ok(None);
         }
-        false
+        build_pattern(&all_patterns.join("|")).map(Some)
     }
 
-    pub fn filter_domains(&self, domains: &HashSet<String>) -> (HashSet<String>, usize) {
-        if self.exact_domains.is_empty() && self.combined_pattern.is_none() {
-            return (domains.clone(), 0);
-        }
-
-        let mut filtered = HashSet::with_capacity(domains.len());
-        let mut removed = 0usize;
-
-        for domain in domains {
-            let mut matched = false;
-
+    fn match_kind(&self, domain: &str) -> Option<MatchKind> {
+        // Almost every blocklist domain misses the Bloom filter and skips both
+        // the exact lookup and the trie walk
+        if self.suffix_bloom.may_contain(base_suffix(domain)) {
             // Exact match (O(1) set lookup)
-            if self.exact_domains.contains(domain.as_str()) {
-                matched = true;
+            if self.exact_domains.contains(domain) {
+                return Some(MatchKind::Exact);
             }
 
-            // Subdomain match (O(k) where k = domain label count)
-            if !matched && self.enable_subdomain {
-                matched = self.check_subdomain(domain);
+            // Subdomain or `*.domain` match (at most one trie step per label)
+            if let Some(kind) = self
+                .suffix_trie
+                .match_parents(domain, self.enable_subdomain)
+            {
+                return Some(kind);
             }
+        }
 
-            // Wildcard/regex match (single combined pattern)
-            if !matched {
-                if let Some(ref re) = self.combined_pattern {
-                    matched = re.is_match(domain);
-                }
-            }
+        // Wildcard/regex match (single combined pattern)
+        self.combined_pattern
+            .as_ref()
+            .is_some_and(|re| re.is_match(domain))
+            .then_some(MatchKind::Pattern)
+    }
+
+    /// Return the whitelisted subset of `domains` (which must be sorted) along
+    /// with how each one matched. Surviving domains are never copied; callers
+    /// drop the returned keys themselves.
+    pub fn filter_domains(&self, domains: &[&str]) -> HashMap<String, MatchKind> {
+        if self.exact_domains.is_empty() && self.patterns.is_empty() {
+            return HashMap::new();
+        }
 
-            if matched {
-                removed += 1;
+        let removed: HashMap<String, MatchKind> =
+            if self.patterns.is_empty() && !self.enable_subdomain {
+                // Exact entries only: probe the (small) whitelist against the sorted domains
+                self.exact_domains
+                    .iter()
+                    .filter(|d| domains.binary_search(&d.as_str()).is_ok())
+                    .map(|d| (d.clone(), MatchKind::Exact))
+                    .collect()
             } else {
-                filtered.insert(domain.clone());
-            }
+                domains
+                    .iter()
+                    .filter_map(|d| Some((d.to_string(), self.match_kind(d)?)))
+                    .collect()
+            };
+
+        if !removed.is_empty() {
+            info!("Filtered {} whitelisted domains", removed.len());
         }
 
-        if removed > 0 {
-            info!("Filtered {removed} whitelisted domains");
+        removed
+    }
+
+    /// Attribute each domain to the first whitelist pattern it matches. A
+    /// RegexSet reports every matching pattern in one pass over the domain,
+    /// so there is no need to retry patterns one by one.
+    fn count_pattern_matches(&self, domains: &[&str]) -> Vec<(&str, usize)> {
+        let set = RegexSetBuilder::new(self.patterns.iter().map(|p| &p.regex))
+            .size_limit(COMBINED_SIZE_LIMIT)
+            .dfa_size_limit(COMBINED_DFA_SIZE_LIMIT)
+            .build();
+        let set = match set {
+            Ok(set) => set,
+            Err(e) => {
+                warn!("Failed to compile whitelist pattern set for report: {e}");
+                return Vec::new();
+            }
+        };
+
+        let mut counts = vec![0usize; self.patterns.len()];
+        for domain in domains {
+            if let Some(idx) = set.matches(domain).into_iter().next() {
+                counts[idx] += 1;
+            }
         }
 
-        (filtered, removed)
+        let mut by_pattern: Vec<(&str, usize)> = self
+            .patterns
+            .iter()
+            .zip(counts)
+            .filter(|(_, count)| *count > 0)
+            .map(|(p, count)| (p.label.as_str(), count))
+            .collect();
+        by_pattern.sort_by(|a, b| b.1.cmp(&a.1).then(a.0.cmp(b.0)));
+        by_pattern
     }
 
     pub fn generate_report(
         &self,
         output_file: &str,
-        removed_domains: &HashSet<String>,
+        removed_domains: &HashMap<String, MatchKind>,
     ) -> Result<()> {
-        use std::io::Write;
-
         let file = std::fs::File::create(output_file)?;
         let mut w = std::io::BufWriter::new(file);
 
@@ -183,54 +458,29 @@ impl WhitelistManager {
         writeln!(w, "Total Domains Removed: {}", removed_domains.len())?;
         writeln!(w)?;
 
-        // Categorize removed domains by match type
+        // Group removed domains by the match type recorded while filtering
         let mut exact = Vec::new();
         let mut subdomain = Vec::new();
         let mut pattern = Vec::new();
 
-        for domain in removed_domains {
-            if self.exact_domains.contains(domain.as_str()) {
-                exact.push(domain.as_str());
-            } else if self.enable_subdomain && self.check_subdomain(domain) {
-                subdomain.push(domain.as_str());
-            } else {
-                pattern.push(domain.as_str());
+        for (domain, kind) in removed_domains {
+            match kind {
+                MatchKind::Exact => exact.push(domain.as_str()),
+                MatchKind::Subdomain => subdomain.push(domain.as_str()),
+                MatchKind::Pattern => pattern.push(domain.as_str()),
             }
         }
 
-        exact.sort();
-        subdomain.sort();
-        pattern.sort();
-
-        if !exact.is_empty() {
-            writeln!(w, "Exact Matches: {}", exact.len())?;
-            for d in exact.iter().take(100) {
-                writeln!(w, "  - {d}")?;
-            }
-            if exact.len() > 100 {
-                writeln!(w, "  ... and {} more", exact.len() - 100)?;
-            }
-            writeln!(w)?;
-        }
-
-        if !subdomain.is_empty() {
-            writeln!(w, "Subdomain Matches: {}", subdomain.len())?;
-            for d in subdomain.iter().take(100) {
-                writeln!(w, "  - {d}")?;
-            }
-            if subdomain.len() > 100 {
-                writeln!(w, "  ... and {} more", subdomain.len() - 100)?;
-            }
-            writeln!(w)?;
-        }
+        write_report_section(&mut w, "Exact Matches", &mut exact)?;
+        write_report_section(&mut w, "Subdomain Matches", &mut subdomain)?;
 
         if !pattern.is_empty() {
-            writeln!(w, "Pattern Matches (wildcard/regex): {}", pattern.len())?;
-            for d in pattern.iter().take(100) {
-                writeln!(w, "  - {d}")?;
-            }
-            if pattern.len() > 100 {
-                writeln!(w, "  ... and {} more", pattern.len() - 100)?;
+            let by_pattern = self.count_pattern_matches(&pattern);
+            write_report_section(&mut w, "Pattern Matches (wildcard/regex)", &mut pattern)?;
+
+            writeln!(w, "Matches by Pattern:")?;
+            for (label, count) in by_pattern {
+                writeln!(w, "  {label}: {count}")?;
             }
             writeln!(w)?;
         }
@@ -239,3 +489,164 @@ impl WhitelistManager {
         Ok(())
     }
 }
+
+/// Write a report section listing the alphabetically first `REPORT_SAMPLE_SIZE`
+/// domains. Only that head is sorted; the rest are just counted.
+fn write_report_section(w: &mut impl Write, title: &str, domains: &mut [&str]) -> Result<()> {
+    if domains.is_empty() {
+        return Ok(());
+    }
+
+    writeln!(w, "{title}: {}", domains.len())?;
+    let shown = domains.len().min(REPORT_SAMPLE_SIZE);
+    if domains.len() > shown {
+        domains.select_nth_unstable(shown);
+    }
+    let head = &mut domains[..shown];
+    head.sort_unstable();
+    for d in head.iter() {
+        writeln!(w, "  - {d}")?;
+    }
+    if domains.len() > shown {
+        writeln!(w, "  ... and {} more", domains.len() - shown)?;
+    }
+    writeln!(w)?;
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn load_from(name: &str, content: &str) -> WhitelistManager {
+        let path = std::env::temp_dir().join(format!(
+            "pihole-optimizer-{}-{name}.txt",
+            std::process::id()
+        ));
+        std::fs::write(&path, content).unwrap();
+        let manager = WhitelistManager::load(path.to_str().unwrap(), true);
+        std::fs::remove_file(&path).unwrap();
+        manager
+    }
+
+    #[test]
+    fn filter_domains_records_match_kind() {
+        let wl = load_from("kinds", "example.com\n*.cdn.net\n");
+        let removed =
+            wl.filter_domains(&["a.cdn.net", "ads.example.com", "example.com", "keep.org"]);
+        assert_eq!(removed.len(), 3);
+        assert_eq!(removed["example.com"], MatchKind::Exact);
+        assert_eq!(removed["ads.example.com"], MatchKind::Subdomain);
+        assert_eq!(removed["a.cdn.net"], MatchKind::Pattern);
+    }
+
+    #[test]
+    fn oversized_pattern_only_drops_itself() {
+        let wl = load_from(
+            "oversized",
+            "/^(?:\\w{1000}){1000}$/\n/^api\\./\nads.*.net\n",
+        );
+        assert_eq!(wl.patterns.len(), 2);
+        let removed = wl.filter_domains(&["ads.x.net", "api.example.com", "keep.org"]);
+        assert_eq!(removed.len(), 2);
+        assert_eq!(removed["api.example.com"], MatchKind::Pattern);
+    }
+
+    #[test]
+    fn count_pattern_matches_attributes_each_domain_once() {
+        let wl = load_from("patterns", "*.cdn.example.com\n/^api\\./\n");
+        let counts = wl.count_pattern_matches(&[
+            "a.cdn.example.com",
+            "b.cdn.example.com",
+            "api.cdn.example.com",
+            "api.other.net",
+        ]);
+        assert_eq!(
+            counts,
+            [
+                ("*.cdn.example.com (wildcard)", 3),
+                ("/^api\\./ (regex)", 1)
+            ]
+        );
+    }
+
+    #[test]
+    fn report_section_lists_sorted_head_and_counts_tail() {
+        let mut domains: Vec<String> = (0..150).rev().map(|i| format!("d{i:03}.com")).collect();
+        domains.push("a.com".into());
+        let mut refs: Vec<&str> = domains.iter().map(String::as_str).collect();
+        let mut out = Vec::new();
+        write_report_section(&mut out, "Exact Matches", &mut refs).unwrap();
+        let out = String::from_utf8(out).unwrap();
+        let lines: Vec<&str> = out.lines().collect();
+        assert_eq!(lines[0], "Exact Matches: 151");
+        assert_eq!(lines[1], "  - a.com");
+        assert_eq!(lines[2], "  - d000.com");
+        assert_eq!(lines[100], "  - d098.com");
+        assert_eq!(lines[101], "  ... and 51 more");
+    }
+
+    #[test]
+    fn bloom_filter_has_no_false_negatives() {
+        let keys: Vec<String> = (0..1000).map(|i| format!("site{i}.com")).collect();
+        let mut bloom = BloomFilter::with_capacity(keys.len(), BLOOM_FALSE_POSITIVE_RATE);
+        for key in &keys {
+            bloom.insert(key);
+        }
+        assert!(keys.iter().all(|k| bloom.may_contain(k)));
+        let false_positives = (0..1000)
+            .filter(|i| bloom.may_contain(&format!("other{i}.net")))
+            .count();
+        assert!(false_positives < 20, "{false_positives} false positives");
+    }
+
+    #[test]
+    fn base_suffix_keeps_last_two_labels() {
+        assert_eq!(base_suffix("a.b.example.com"), "example.com");
+        assert_eq!(base_suffix("example.com"), "example.com");
+        assert_eq!(base_suffix("com"), "com");
+    }
+
+    #[test]
+    fn suffix_trie_matches_only_proper_subdomains() {
+        let mut trie = SuffixTrie::default();
+        trie.insert("example.com");
+        trie.insert("deep.sub.example.org");
+        let subdomain = Some(MatchKind::Subdomain);
+        assert_eq!(trie.match_parents("a.example.com", true), subdomain);
+        assert_eq!(trie.match_parents("a.b.example.com", true), subdomain);
+        assert_eq!(
+            trie.match_parents("x.deep.sub.example.org", true),
+            subdomain
+        );
+        assert_eq!(trie.match_parents("a.example.com", false), None);
+        assert_eq!(trie.match_parents("example.com", true), None);
+        assert_eq!(trie.match_parents("sub.example.org", true), None);
+        assert_eq!(trie.match_parents("notexample.com", true), None);
+        assert_eq!(trie.match_parents("||a.example.com^", true), None);
+    }
+
+    #[test]
+    fn suffix_trie_wildcards_match_as_patterns() {
+        let mut trie = SuffixTrie::default();
+        trie.insert_wildcard("tracking.com");
+        trie.insert("sub.tracking.com");
+        let pattern = Some(MatchKind::Pattern);
+        assert_eq!(trie.match_parents("a.tracking.com", true), pattern);
+        assert_eq!(
+            trie.match_parents("a.sub.tracking.com", true),
+            Some(MatchKind::Subdomain)
+        );
+        assert_eq!(trie.match_parents("a.sub.tracking.com", false), pattern);
+        assert_eq!(trie.match_parents("tracking.com", true), None);
+    }
+
+    #[test]
+    fn trie_wildcards_only_take_plain_domains() {
+        assert_eq!(trie_wildcard("*.tracking.com"), Some("tracking.com"));
+        assert_eq!(trie_wildcard("*.com"), None);
+        assert_eq!(trie_wildcard("*.a+b.com"), None);
+        assert_eq!(trie_wildcard("*.cdn.*.com"), None);
+        assert_eq!(trie_wildcard("ads.*"), None);
+    }
+}